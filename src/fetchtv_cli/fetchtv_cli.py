@@ -1,19 +1,27 @@
 from __future__ import annotations
 
+import atexit
 import json
 import logging
 import os
 import re
+import textwrap
+import threading
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import fields
 
 import requests
 from datetime import datetime
-import jsonpickle
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ChunkedEncodingError
 from rich.progress import Progress, TransferSpeedColumn
 from rich.table import Table
 from rich.tree import Tree
 from urllib3.exceptions import IncompleteRead
+from urllib3.util.retry import Retry
 import click
 from rich.console import Console
 
@@ -31,13 +39,44 @@ install(show_locals=True)
 SAVE_FILE = 'fetchtv_save_list.json'
 FETCHTV_PORT = 49152
 CONST_LOCK = '.lock'
+CONST_IN_PROGRESS = '.inprogress'
 MAX_FILENAME = 255
+# Remove special characters, and replace whitespace
+FILENAME_TRANSLATION = str.maketrans({**{c: None for c in '<>:"/\\|?*'}, '\t': '_', ' ': '_'})
+EPISODE_REGEX = re.compile(r'^S\d+ E\d+')
 REQUEST_TIMEOUT = 5
 MAX_OCTET = 4398046510080
+CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'fetchtv', 'location.json')
+CACHE_TTL = 24 * 60 * 60
+DEFAULT_CONCURRENCY = 4
+PROBE_CONCURRENCY = 8
+HTTP_POOL_SIZE = 16
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+PROGRESS_INTERVAL = 0.5
+PROGRESS_REFRESH = 4
+SAVE_FLUSH_COUNT = 10
+SAVE_FLUSH_INTERVAL = 30
+IN_PROGRESS_GRACE = 60  # Seconds a new in progress marker may be empty, before the pid is written
 
 console = Console(highlight=False, log_path=False)
 
 
+def create_session() -> requests.Session:
+    """
+    Create a session that keeps connections to the Fetch box alive between requests
+    """
+    session = requests.Session()
+    retries = Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+SESSION = create_session()
+
+
 class SavedFiles:
     """
     FetchTV recorded items that have already been saved
@@ -49,80 +88,260 @@ class SavedFiles:
         """
         Instantiate from JSON file, if it exists
         """
-        with open(path + os.path.sep + SAVE_FILE, 'a+') as read_file:
-            read_file.seek(0)
-            content = read_file.read()
-            inst = jsonpickle.loads(content) if content else SavedFiles()
-            inst.path = path
+        inst = SavedFiles(path)
+        if not os.path.exists(inst._save_file_path) or not os.path.getsize(inst._save_file_path):
             return inst
 
-    def __init__(self):
-        self.__files = {}
-        self.path = ''
+        with open(inst._save_file_path) as read_file:
+            content = json.load(read_file)
+        if 'files' in content:
+            inst._files = content['files']
+        else:
+            # Saved by a version using jsonpickle, convert it to the current format
+            state = content.get('py/state', content)
+            inst._files = state.get('_files', state.get('_SavedFiles__files', {}))
+            inst._write()
+        return inst
+
+    def __init__(self, path: str = ''):
+        self._files = {}
+        self.path = path
+        self._save_file_path = os.path.join(path, SAVE_FILE)
+        self._mark_flushed()
+
+    def _mark_flushed(self):
+        self._pending = 0
+        self._last_flush = time.monotonic()
 
     def add_file(self, item):
-        self.__files[item.id] = item.title
-        # Serialise after each success
-        with open(self.path + os.path.sep + SAVE_FILE, 'w') as write_file:
-            write_file.write(jsonpickle.dumps(self))
+        """
+        Record an item as saved; call flush() to write it to disk
+        """
+        self._files[item.id] = item.title
+        self._pending += 1
+
+    def flush_due(self) -> bool:
+        return self._pending >= SAVE_FLUSH_COUNT or (
+            self._pending and time.monotonic() - self._last_flush >= SAVE_FLUSH_INTERVAL
+        )
+
+    def flush(self):
+        """
+        Write the saved files to disk, if anything has changed since the last flush
+        """
+        if self._pending:
+            self._write()
+
+    def _write(self):
+        # Write to a temporary file first, so an interrupted write can't corrupt the list
+        with open(self._save_file_path + '.tmp', 'w') as write_file:
+            json.dump({'path': self.path, 'files': self._files}, write_file)
+        os.replace(self._save_file_path + '.tmp', self._save_file_path)
+        self._mark_flushed()
 
     def contains(self, item):
-        return item.id in self.__files.keys()
+        return item.id in self._files
+
+    def contains_id(self, item_id: str) -> bool:
+        return item_id in self._files
 
 
 def create_valid_filename(filename: str) -> str:
-    result = filename.strip()
-    # Remove special characters
-    for c in '<>:"/\\|?*':
-        result = result.replace(c, '')
-    # Remove whitespace
-    for c in '\t ':
-        result = result.replace(c, '_')
-    return result[:MAX_FILENAME]
+    return filename.strip().translate(FILENAME_TRANSLATION)[:MAX_FILENAME]
 
 
-def download_file(item: upnp.Item, filename: str, json_result: dict) -> bool:
-    """
-    Download the url contents to a file
-    """
-    progress = Progress(
+def create_progress() -> Progress:
+    return Progress(
         *Progress.get_default_columns(),
         TransferSpeedColumn(),
         console=console,
+        refresh_per_second=PROGRESS_REFRESH,
     )
-    console.log(f'Writing: [{item.title}] to [{filename}]', markup=False)
-    with requests.get(item.url, stream=True) as r:
+
+
+def skip_currently_recording(json_result: dict) -> bool:
+    msg = "Skipping item it's currently recording"
+    print_warning(msg)
+    json_result['warning'] = msg
+    return False
+
+
+def get_total_length(r: requests.Response, resume_from: int) -> int:
+    """
+    Return the full length of an item, from either a partial or full response
+    """
+    total = r.headers.get('content-range', '').rpartition('/')[2]
+    if r.status_code == 206 and total.isdigit():
+        return int(total)
+    return resume_from + int(r.headers.get('content-length'))
+
+
+def in_progress_is_stale(in_progress: str) -> bool:
+    """
+    Check if the process that created an in progress marker has gone, e.g. it was killed
+    """
+    try:
+        with open(in_progress) as f:
+            pid = int(f.read())
+    except FileNotFoundError:
+        return True
+    except ValueError:
+        # The marker may have only just been created, with the pid not yet written
+        try:
+            return time.time() - os.path.getmtime(in_progress) > IN_PROGRESS_GRACE
+        except FileNotFoundError:
+            return True
+    if os.name == 'nt':
+        # Signal 0 is CTRL_C_EVENT on Windows, so there's no safe check
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass  # Still running, as another user
+    return False
+
+
+def create_in_progress(in_progress: str) -> bool:
+    """
+    Create the in progress marker, replacing a stale one. Return False if another writer has it
+    """
+    for _ in range(2):
+        try:
+            with open(in_progress, 'x') as f:
+                f.write(str(os.getpid()))
+            return True
+        except FileExistsError:
+            if not in_progress_is_stale(in_progress):
+                return False
+            logging.debug(f'Removing stale in progress marker: {in_progress}')
+            try:
+                os.remove(in_progress)
+            except FileNotFoundError:
+                pass
+    return False
+
+
+def download_file(
+    item: upnp.Item,
+    filename: str,
+    json_result: dict,
+    progress: Progress | None = None,
+    total_length: int | None = None,
+    abort: threading.Event | None = None,
+) -> bool:
+    """
+    Download the url contents to a file, resuming a previous partial download if there is one
+
+    A shared progress display can be passed in when several downloads run at once, the
+    content length if it is already known, and an event to stop the download part way
+    """
+    # No need to request the item if it's already known to be recording
+    if total_length == MAX_OCTET:
+        console.log(f'Writing: [{item.title}] to [{filename}]', markup=False)
+        return skip_currently_recording(json_result)
+
+    # The marker stops another writer, so the lock file can be resumed
+    in_progress = filename + CONST_IN_PROGRESS
+    if not create_in_progress(in_progress):
+        msg = 'Already writing (in progress marker exists) skipping'
+        print_warning(msg)
+        json_result['warning'] = msg
+        return False
+
+    try:
+        return write_file(item, filename, json_result, progress, total_length, abort)
+    finally:
+        os.remove(in_progress)
+
+
+def write_file(
+    item: upnp.Item,
+    filename: str,
+    json_result: dict,
+    progress: Progress | None,
+    total_length: int | None,
+    abort: threading.Event | None = None,
+) -> bool:
+    # Only start/stop the display if it isn't shared
+    shared = progress is not None
+    live = nullcontext() if shared else create_progress()
+    progress = progress or live
+    lock_file = filename + CONST_LOCK
+    resume_from = os.path.getsize(lock_file) if os.path.exists(lock_file) else 0
+    if resume_from:
+        console.log(f'Resuming: [{item.title}] to [{filename}] from {resume_from} bytes', markup=False)
+    else:
+        console.log(f'Writing: [{item.title}] to [{filename}]', markup=False)
+
+    headers = {'Range': f'bytes={resume_from}-'} if resume_from else {}
+    r = SESSION.get(item.url, stream=True, timeout=REQUEST_TIMEOUT, headers=headers)
+    if resume_from and r.status_code == 416:
+        r.close()
+        if r.headers.get('content-range', '').rpartition('/')[2] == str(resume_from):
+            # The partial file already has everything the Fetch box can send
+            os.rename(lock_file, filename)
+            return True
+        # The partial file doesn't match the item, so start again
+        console.log(f'Partial file does not match: [{item.title}], writing from the beginning', markup=False)
+        os.remove(lock_file)
+        resume_from = 0
+        r = SESSION.get(item.url, stream=True, timeout=REQUEST_TIMEOUT, headers={})
+
+    with r:
         r.raise_for_status()
-        total_length = int(r.headers.get('content-length'))
-        if total_length == MAX_OCTET:
-            msg = "Skipping item it's currently recording"
-            print_warning(msg)
-            json_result['warning'] = msg
-            return False
+        if r.status_code != 206:
+            # Range not requested or not supported, so start from the beginning
+            resume_from = 0
+        if total_length is None:
+            total_length = get_total_length(r, resume_from)
+            if total_length == MAX_OCTET:
+                return skip_currently_recording(json_result)
 
         try:
-            with open(filename + CONST_LOCK, 'xb') as f:
-                with progress:
-                    task = progress.add_task('Downloading', total=total_length)
+            with open(lock_file, 'ab' if resume_from else 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                with live:
+                    task = progress.add_task(item.title, total=total_length, completed=resume_from)
                     progress.start_task(task)
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:  # filter out keep-alive new chunks
-                            f.write(chunk)
-                            progress.update(task, advance=len(chunk))
+                    try:
+                        # Only update the progress at intervals, not for every chunk
+                        pending = 0
+                        last_update = time.monotonic()
+                        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            if abort and abort.is_set():
+                                # Keep the partial file, so the next run can resume it
+                                msg = 'Save interrupted, partial file kept'
+                                print_warning(msg)
+                                json_result['warning'] = msg
+                                return False
+                            if chunk:  # filter out keep-alive new chunks
+                                f.write(chunk)
+                                pending += len(chunk)
+                                if time.monotonic() - last_update >= PROGRESS_INTERVAL:
+                                    progress.update(task, advance=pending)
+                                    pending = 0
+                                    last_update = time.monotonic()
+                        progress.update(task, advance=pending)
+                    finally:
+                        # Finished items would otherwise push active ones off a shared display
+                        if shared:
+                            progress.remove_task(task)
 
-        except FileExistsError:
-            msg = 'Already writing (lock file exists) skipping'
-            print_warning(msg)
-            json_result['warning'] = msg
-            return False
         except ChunkedEncodingError as err:
-            if err.args:
-                try:
-                    if isinstance(err.args[0].args[1], IncompleteRead):
-                        msg = 'Final read was short; FetchTV sets the wrong Content-Length header. File should be fine'
-                except IndexError:
-                    msg = f'Chunked encoding error occurred. Content length was {total_length}. Error was: {err}'
-
+            try:
+                short_read = isinstance(err.args[0].args[1], IncompleteRead)
+            except (IndexError, AttributeError):
+                short_read = False
+
+            if not short_read:
+                # Keep the partial file, so the next run can resume it
+                msg = f'Chunked encoding error occurred. Content length was {total_length}. Error was: {err}'
+                print_warning(msg)
+                json_result['warning'] = msg
+                return False
+
+            msg = 'Final read was short; FetchTV sets the wrong Content-Length header. File should be fine'
             print_warning(msg)
             json_result['warning'] = msg
         except IOError as err:
@@ -131,7 +350,7 @@ def download_file(item: upnp.Item, filename: str, json_result: dict) -> bool:
             json_result['error'] = msg
             return False
 
-        os.rename(filename + CONST_LOCK, filename)
+        os.rename(lock_file, filename)
         return True
 
 
@@ -149,46 +368,52 @@ def get_fetch_recordings(location: upnp.Location, folder: tuple[str], exclude: t
     return filter_recording_items(folder, exclude, title, shows, is_recording, recordings)
 
 
-def has_include_folder(recording: upnp.Folder, folder: tuple[str]) -> bool:
-    return not (
-        folder
-        and not next(
-            (
-                include_folder
-                for include_folder in folder
-                if recording.title.lower().find(include_folder.strip().lower()) != -1
-            ),
-            False,
-        )
-    )
+def lower_needles(values: tuple[str] | None) -> tuple[str, ...]:
+    """
+    Normalise filter text once, so it isn't repeated for every folder and item
+    """
+    return tuple(value.strip().lower() for value in values or ())
 
 
-def has_exclude_folder(recording: upnp.Folder, exclude: tuple[str]) -> tuple:
-    return exclude and next(
-        (
-            exclude_folder
-            for exclude_folder in exclude
-            if recording.title.lower().find(exclude_folder.strip().lower()) != -1
-        ),
-        False,
-    )
+def has_match(text: str, needles: tuple[str, ...]) -> bool:
+    text = text.lower()
+    return any(needle in text for needle in needles)
 
 
-def has_title_match(item, title):
-    return not (
-        title
-        and not next(
-            (include_title for include_title in title if item.title.lower().find(include_title.strip().lower()) != -1),
-            False,
-        )
-    )
+def has_include_folder(recording: upnp.Folder, folder: tuple[str, ...]) -> bool:
+    return not folder or has_match(recording.title, folder)
 
 
-def currently_recording(item: upnp.Item) -> bool:
-    with requests.get(item.url, stream=True) as r:
+def has_exclude_folder(recording: upnp.Folder, exclude: tuple[str, ...]) -> bool:
+    return has_match(recording.title, exclude)
+
+
+def has_title_match(item: upnp.Item, title: tuple[str, ...]) -> bool:
+    return not title or has_match(item.title, title)
+
+
+def get_content_length(item: upnp.Item, head_rejected: threading.Event) -> int:
+    """
+    Return the content length of an item, using a HEAD request unless the Fetch box has already rejected one
+    """
+    if not head_rejected.is_set():
+        r = SESSION.head(item.url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+        if 200 <= r.status_code < 300 and 'content-length' in r.headers:
+            return int(r.headers['content-length'])
+        # Don't try HEAD again for this run
+        head_rejected.set()
+
+    with SESSION.get(item.url, stream=True, timeout=REQUEST_TIMEOUT) as r:
         r.raise_for_status()
-        total_length = int(r.headers.get('content-length'))
-        return total_length == MAX_OCTET
+        if 'content-length' not in r.headers:
+            raise requests.RequestException(f'No content length for: {item.title}', response=r)
+        return int(r.headers['content-length'])
+
+
+def currently_recording(item: upnp.Item, head_rejected: threading.Event) -> bool:
+    # Keep the length, so saving the item doesn't need to request it again
+    item.probed_length = get_content_length(item, head_rejected)
+    return item.probed_length == MAX_OCTET
 
 
 def filter_recording_items(folder: tuple[str], exclude: tuple[str], title: tuple[str], shows: bool, is_recording: bool,
@@ -196,85 +421,172 @@ def filter_recording_items(folder: tuple[str], exclude: tuple[str], title: tuple
     """
     Process the returned FetchTV recordings and filter the results as per the provided options.
     """
-    results = []
-    for recording in recordings:
-        result = {'title': recording.title, 'id': recording.id, 'items': []}
-        # Skip not matching folders
-        if not has_include_folder(recording, folder) or has_exclude_folder(recording, exclude):
-            continue
-
-        # Process recorded items
-        if not shows:  # Include items
-            for item in recording.items:
-                # Skip not matching titles
-                if not has_title_match(item, title):
-                    continue
+    folder = lower_needles(folder)
+    exclude = lower_needles(exclude)
+    title = lower_needles(title)
+    # Skip not matching folders
+    wanted = [
+        recording
+        for recording in recordings
+        if has_include_folder(recording, folder) and not has_exclude_folder(recording, exclude)
+    ]
+    if shows:
+        # Folders only, so there are no items to filter or check, and no folder can have a recording item
+        if is_recording:
+            return []
+        return [{'title': recording.title, 'id': recording.id, 'items': []} for recording in wanted]
 
-                # Only include recording item if requested
-                if not is_recording or currently_recording(item):
-                    result['items'].append(item)
+    results = []
+    # Set once the Fetch box rejects a HEAD request, so the remaining checks go straight to GET
+    head_rejected = threading.Event()
+    # Currently recording checks are independent requests, so are run concurrently
+    with ThreadPoolExecutor(max_workers=PROBE_CONCURRENCY) as executor:
+        for recording in wanted:
+            # Skip not matching titles
+            items = [item for item in recording.items if has_title_match(item, title)]
+
+            # Only include recording item if requested
+            if is_recording:
+                items = [item for item, recording_now in zip(items, executor.map(lambda item: currently_recording(item, head_rejected), items))
+                         if recording_now]
 
-        results.append(result)
-        if is_recording:
             # Only return folders with a recording item
-            results = [result for result in results if len(result['items']) > 0]
+            if not is_recording or items:
+                results.append({'title': recording.title, 'id': recording.id, 'items': items})
     return results
 
 
-def discover_fetch(ip: str = False, port: int = FETCHTV_PORT) -> upnp.Location | None:
+def load_cached_location() -> str | None:
+    """
+    Return the cached Fetch location URL, if there is one that hasn't expired
+    """
+    try:
+        with open(CACHE_FILE) as read_file:
+            cached = json.load(read_file)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cached.get('timestamp', 0) > CACHE_TTL:
+        return None
+    return cached.get('url')
+
+
+def save_cached_location(url: str) -> None:
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        with open(CACHE_FILE, 'w') as write_file:
+            json.dump({'url': url, 'timestamp': time.time()}, write_file)
+    except OSError as err:
+        logging.debug(f'Unable to cache Fetch location: {err}')
+
+
+def find_fetch_location(location_urls: list[str]) -> upnp.Location | None:
+    locations = upnp.parse_locations(location_urls)
+    return next((location for location in locations if location.manufacturerURL == 'http://www.fetch.com/'), None)
+
+
+def discover_fetch(
+    ip: str = False, port: int = FETCHTV_PORT, use_cache: bool = True, refresh: bool = False
+) -> upnp.Location | None:
+    """
+    Find the Fetch UPnP location, either from the IP address provided, the cache, or by SSDP discovery
+    """
     console.print('Starting discovery')
+    # The cached location is only used instead of SSDP discovery, and is checked before use
+    cached_url = load_cached_location() if not ip and use_cache and not refresh else None
+    if cached_url:
+        try:
+            result = find_fetch_location([cached_url])
+            if result:
+                console.print(f'Discovery successful (cached): {result.url}')
+                return result
+        except (upnp.UpnpError, requests.RequestException) as err:
+            logging.debug(f'Cached Fetch location is invalid: {err}')
+
     try:
         location_urls = (
             upnp.ssdp_discovery(st='urn:schemas-upnp-org:device:MediaServer:1')
             if not ip
             else [f'http://{ip}:{port}/MediaServer.xml']
         )
-        locations = upnp.parse_locations(location_urls)
-        # Find fetch
-        result = [location for location in locations if location.manufacturerURL == 'http://www.fetch.com/']
-        if len(result) == 0:
+        result = find_fetch_location(location_urls)
+        if not result:
             print_error('Discovery failed: ERROR: Unable to locate Fetch UPNP service')
             return None
-        console.print(f'Discovery successful: {result[0].url}')
+        console.print(f'Discovery successful: {result.url}')
     except upnp.UpnpError as err:
         print_error(err)
         return None
 
-    return result[0]
+    if not ip and use_cache:
+        save_cached_location(result.url)
+    return result
 
 
-def save_recordings(recordings: list[dict], save_path: str, overwrite: bool) -> list[dict]:
+def save_recordings(
+    recordings: list[dict], save_path: str, overwrite: bool, concurrency: int = DEFAULT_CONCURRENCY
+) -> list[dict]:
     """
     Save all recordings for the specified folder (if not already saved)
+
+    Items are downloaded concurrently, up to `concurrency` at a time
     """
-    some_to_record = False
-    path = save_path
-    saved_files = SavedFiles.load(path)
+    saved_files = SavedFiles.load(save_path)
+    saved_files_lock = threading.Lock()
+    # Stops downloads part way, rather than waiting for them to finish
+    abort = threading.Event()
+    progress = create_progress()
     json_result = []
+
+    def save_item(item: upnp.Item, file_path: str, result: dict) -> None:
+        if download_file(item, file_path, result, progress, item.probed_length or None, abort):
+            result['recorded'] = True
+            with saved_files_lock:
+                saved_files.add_file(item)
+                if saved_files.flush_due():
+                    saved_files.flush()
+
+    # Work out what needs saving first, so the pool is only as big as the work
+    to_download = []
     for show in recordings:
-        for item in show['items']:
-            if overwrite or not saved_files.contains(item):
-                some_to_record = True
-                directory = path + os.path.sep + create_valid_filename(show['title'])
-                if not os.path.exists(directory):
-                    os.makedirs(directory)
-                file_path = directory + os.path.sep + create_valid_filename(item.title) + '.mpeg'
-
-                result = {'item': create_item(item), 'recorded': False}
-                json_result.append(result)
-                # Check if already writing
-                lock_file = file_path + CONST_LOCK
-                if os.path.exists(lock_file):
-                    msg = 'Already writing (lock file exists) skipping: [%s]' % item.title
-                    print_item(msg)
-                    result['warning'] = msg
-                    continue
-
-                if download_file(item, file_path, result):
-                    result['recorded'] = True
-                    saved_files.add_file(item)
-    if not some_to_record:
+        items = [item for item in show['items'] if overwrite or not saved_files.contains_id(item.id)]
+        if not items:
+            continue
+
+        # Create the show directory once, rather than checking for it per item
+        show_dir = os.path.join(save_path, create_valid_filename(show['title']))
+        os.makedirs(show_dir, exist_ok=True)
+        for item in items:
+            file_path = os.path.join(show_dir, create_valid_filename(item.title) + '.mpeg')
+
+            # Results are kept in submission order, regardless of completion order
+            result = {'item': create_item(item), 'recorded': False}
+            json_result.append(result)
+            to_download.append((item, file_path, result))
+
+    if not to_download:
         print_item('There is nothing new to record')
+        return json_result
+
+    # Make sure progress is persisted, even if interrupted
+    atexit.register(saved_files.flush)
+    try:
+        with progress, ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(to_download)))) as executor:
+            futures = [executor.submit(save_item, *download) for download in to_download]
+            try:
+                # Surface any unexpected worker exception
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # Don't wait for queued or running downloads, e.g. on Ctrl-C
+                abort.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        # Downloads already running may still be adding files
+        with saved_files_lock:
+            saved_files.flush()
+        atexit.unregister(saved_files.flush)
+
     return json_result
 
 
@@ -295,7 +607,7 @@ def print_heading(param: str) -> None:
 
 
 def create_item(item: upnp.Item) -> dict:
-    item_type = 'episode' if re.match('^S\\d+ E\\d+', item.title) else 'movie'
+    item_type = 'episode' if EPISODE_REGEX.match(item.title) else 'movie'
     return {
         'id': item.id,
         'title': item.title,
@@ -306,7 +618,22 @@ def create_item(item: upnp.Item) -> dict:
     }
 
 
-def print_recordings(recordings: list[dict], output_json: bool, show_table: bool = True) -> str | None:
+def print_json(values: Iterable) -> None:
+    """
+    Write a JSON list one element at a time, rather than serialising it all at once
+    """
+    output = console.file
+    output.write('[')
+    empty = True
+    for value in values:
+        output.write('\n' if empty else ',\n')
+        output.write(textwrap.indent(json.dumps(value, indent=2, ensure_ascii=False), '  '))
+        empty = False
+    output.write(']\n' if empty else '\n]\n')
+    output.flush()
+
+
+def print_recordings(recordings: list[dict], output_json: bool, show_table: bool = True) -> None:
     if not output_json:
         print_heading('List recordings')
         if not recordings:
@@ -341,14 +668,14 @@ def print_recordings(recordings: list[dict], output_json: bool, show_table: bool
                     title.add(recording_table)
         console.print(tree)
     else:
-        output = []
-        for recording in recordings:
-            items = []
-            output.append({'id': recording['id'], 'title': recording['title'], 'items': items})
-            for item in recording['items']:
-                items.append(create_item(item))
-        console.print_json(data=output)
-        return json.dumps(output)
+        print_json(
+            {
+                'id': recording['id'],
+                'title': recording['title'],
+                'items': [create_item(item) for item in recording['items']],
+            }
+            for recording in recordings
+        )
 
 
 @click.command()
@@ -358,8 +685,16 @@ def print_recordings(recordings: list[dict], output_json: bool, show_table: bool
 @click.option('--isrecording', is_flag=True, help='List any items that are currently recording')
 @click.option('--ip', default=None, help='Specify the IP Address of the Fetch Server, if auto-discovery fails')
 @click.option('--port', default=FETCHTV_PORT, help='Specify the port of the Fetch Server, if auto-discovery fails')
+@click.option('--no-cache', is_flag=True, help="Don't use or update the cached auto-discovery result")
+@click.option('--refresh', is_flag=True, help='Ignore the cached auto-discovery result and discover again')
 @click.option('--overwrite', is_flag=True, help='Will save and overwrite any existing files')
 @click.option('--save', default=None, help='Save recordings to the specified path')
+@click.option(
+    '--concurrency',
+    default=DEFAULT_CONCURRENCY,
+    type=click.IntRange(1, 8),
+    help='Number of recordings to save at the same time',
+)
 @click.option(
     '--folder', default=None, multiple=True, help='Only return recordings where the folder contains the specified text'
 )
@@ -367,7 +702,7 @@ def print_recordings(recordings: list[dict], output_json: bool, show_table: bool
 @click.option(
     '--title', default=None, multiple=True, help='Only return recordings where the item contains the specified text'
 )
-@click.option('--json', is_flag=True, help='Output show/recording/save results in JSON')
+@click.option('--json', 'output_json', is_flag=True, help='Output show/recording/save results in JSON')
 @click.option('--debug', is_flag=True, help='Enable debug mode')
 @click.option('--table/--no-table', 'show_table', is_flag=True, default=True, help='Show recordings in a table')
 def main(
@@ -377,12 +712,15 @@ def main(
     isrecording: bool,
     ip: str,
     port: int,
+    no_cache: bool,
+    refresh: bool,
     overwrite: bool,
     save: str,
+    concurrency: int,
     folder: tuple[str],
     exclude: tuple[str],
     title: tuple[str],
-    json: bool,
+    output_json: bool,
     debug: bool,
     show_table: bool,
 ) -> None:
@@ -399,7 +737,7 @@ def main(
 
     print_heading(f'Started: {datetime.now():%Y-%m-%d %H:%M:%S}')
     with console.status('Discover Fetch UPnP location...'):
-        fetch_server = discover_fetch(ip=ip, port=port)
+        fetch_server = discover_fetch(ip=ip, port=port, use_cache=not no_cache, refresh=refresh)
 
     if not fetch_server:
         return
@@ -420,13 +758,13 @@ def main(
         with console.status('Getting Fetch recordings...'):
             fetch_recordings = get_fetch_recordings(fetch_server, folder, exclude, title, shows, isrecording)
         if not save:
-            print_recordings(fetch_recordings, json, show_table)
+            print_recordings(fetch_recordings, output_json, show_table)
         else:
             # with console.status('Saving recordings'):
             print_heading('Saving recordings')
-            json_result = save_recordings(fetch_recordings, save, overwrite)
-            if json:
-                console.print_json(data=json_result)
+            json_result = save_recordings(fetch_recordings, save, overwrite, concurrency)
+            if output_json:
+                print_json(json_result)
     print_heading(f'Done: {datetime.now():%Y-%m-%d %H:%M:%S}')
 
 
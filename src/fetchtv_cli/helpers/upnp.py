@@ -1,6 +1,7 @@
 import logging
 import re
 import socket
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field, InitVar
 
 import requests
@@ -13,6 +14,7 @@ except ImportError:
 
 DISCOVERY_TIMEOUT = 3
 REQUEST_TIMEOUT = 5
+BROWSE_CONCURRENCY = 8
 NO_NUMBER_DEFAULT = ''
 
 logger = logging.getLogger(__name__)
@@ -191,6 +193,8 @@ class Item:
     parent_name: str = field(init=False)
     recorded: str = field(init=False)
     protocol_info: ProtocolInfo = field(init=False)
+    # Content length from a request for the item, 0 if not requested
+    probed_length: int = field(default=0, init=False, repr=False)
 
     def __post_init__(self, xml):
         self.type = xml.find('./{urn:schemas-upnp-org:metadata-1-0/upnp/}class').text
@@ -383,9 +387,12 @@ def find_directories(api_service: dict, object_id: str = '0') -> list[Folder]:
     containers = xml_root.findall('./{urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/}container')
     for container in containers:
         if container.find('./{urn:schemas-upnp-org:metadata-1-0/upnp/}class').text.find('object.container') > -1:
-            folder = Folder(container)
-            result.append(folder)
-            folder.add_items(find_items(p_url, p_service, container.attrib['id']))
+            result.append(Folder(container))
+
+    # Each folder needs its own Browse request, so send them concurrently
+    with ThreadPoolExecutor(max_workers=BROWSE_CONCURRENCY) as executor:
+        for folder, items in zip(result, executor.map(lambda f: find_items(p_url, p_service, f.id), result)):
+            folder.add_items(items)
     return result
 
 
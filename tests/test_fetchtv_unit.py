@@ -1,10 +1,15 @@
 import json
 import os
 import pytest
+import requests
 from click.testing import CliRunner
 
 from src.fetchtv_cli import fetchtv_cli as fetchtv
+import subprocess
+import sys
 import tempfile
+import threading
+import time
 from unittest.mock import Mock, patch, mock_open
 
 OPTION_IP = '--ip'
@@ -37,10 +42,10 @@ def get_file(filename):
         return file.read()
 
 
-def mock_get(p_url, timeout=0, stream=False):
+def mock_get(p_url, timeout=0, stream=False, headers=None):
     result = Mock()
     result.__enter__ = Mock(return_value=result)
-    result.__exit__ = Mock()
+    result.__exit__ = Mock(return_value=False)
     result.iter_content = Mock(return_value='0')
     result.status_code = 200
     # Simulate a recording item
@@ -57,10 +62,35 @@ def mock_get(p_url, timeout=0, stream=False):
     return result
 
 
-def mock_get_recording(p_url, timeout=0, stream=False):
+def mock_head(p_url, timeout=0, allow_redirects=False):
+    return mock_get(p_url, timeout)
+
+
+def mock_head_not_allowed(p_url, timeout=0, allow_redirects=False):
+    result = Mock()
+    result.status_code = 405
+    return result
+
+
+def mock_item():
+    item = Mock()
+    item.title = SHOW_ONE_EP_ONE
+    item.url = URL_DUMMY
+    return item
+
+
+def mock_partial_get(content, start, total):
+    result = mock_get(URL_DUMMY)
+    result.status_code = 206
+    result.headers = {'content-length': len(content), 'content-range': f'bytes {start}-{total - 1}/{total}'}
+    result.iter_content = Mock(return_value=[content])
+    return result
+
+
+def mock_get_recording(p_url, timeout=0, stream=False, headers=None):
     result = Mock()
     result.__enter__ = Mock(return_value=result)
-    result.__exit__ = Mock()
+    result.__exit__ = Mock(return_value=False)
     result.iter_content = Mock(return_value='0')
     result.status_code = 200
     result.headers = {'content-length': fetchtv.MAX_OCTET}
@@ -75,7 +105,7 @@ def mock_get_recording(p_url, timeout=0, stream=False):
 def mock_post(p_url, data, headers):
     result = Mock()
     result.__enter__ = Mock()
-    result.__exit__ = Mock()
+    result.__exit__ = Mock(return_value=False)
     result.status_code = 200
 
     response_dir = os.path.dirname(__file__) + os.path.sep + 'responses' + os.path.sep
@@ -149,6 +179,8 @@ class TestOptions:
 
 
 @patch('requests.get', mock_get)
+@patch.object(fetchtv.SESSION, 'get', mock_get)
+@patch.object(fetchtv.SESSION, 'head', mock_head)
 @patch('requests.post', mock_post)
 class TestGetFetchRecordings:
 
@@ -159,14 +191,12 @@ class TestGetFetchRecordings:
         fetchtv.print_recordings(results, False)
         assert len(results) == 8
 
-    def test_get_shows_json(self):
+    def test_get_shows_json(self, capsys):
         fetch_server = Mock()
         fetch_server.url = URL_DUMMY
         results = fetchtv.get_fetch_recordings(fetch_server, [], [], [], True, False)
-        print(results)
-        output = fetchtv.print_recordings(results, True)
-        print(output)
-        output = json.loads(output)
+        fetchtv.print_recordings(results, True)
+        output = json.loads(capsys.readouterr().out)
         assert len(output) == 8
 
     def test_no_recordings_folder(self):
@@ -184,24 +214,65 @@ class TestGetFetchRecordings:
         assert len(results) == 8
         assert len(results[4]['items']) == 134
 
-    def test_get_all_recordings_json(self):
+    def test_get_all_recordings_json(self, capsys):
         fetch_server = Mock()
         fetch_server.url = URL_DUMMY
         results = fetchtv.get_fetch_recordings(fetch_server, [], [], [], False, False)
-        output = fetchtv.print_recordings(results, True)
-        output = json.loads(output)
+        fetchtv.print_recordings(results, True)
+        output = json.loads(capsys.readouterr().out)
         assert len(output) == 8
         assert len(output[4]['items']) == 134
 
-    def test_get_recordings_items_json(self):
+    def test_get_recordings_items_json(self, capsys):
         fetch_server = Mock()
         fetch_server.url = URL_DUMMY
         results = fetchtv.get_fetch_recordings(fetch_server, [], [], [], False, True)
-        output = fetchtv.print_recordings(results, True)
-        output = json.loads(output)
+        fetchtv.print_recordings(results, True)
+        output = json.loads(capsys.readouterr().out)
         assert len(output) == 1
         assert len(output[0]['items']) == 1
 
+    def test_no_recordings_json(self, capsys):
+        fetchtv.print_recordings([], True)
+        assert json.loads(capsys.readouterr().out) == []
+
+    def test_json_keeps_non_ascii(self, capsys):
+        fetchtv.print_json([{'title': 'Café Élan'}])
+        assert 'Café Élan' in capsys.readouterr().out
+
+    def test_get_recordings_items_without_head(self):
+        fetch_server = Mock()
+        fetch_server.url = URL_DUMMY
+        with patch.object(fetchtv.SESSION, 'head', Mock(side_effect=mock_head_not_allowed)) as head:
+            results = fetchtv.get_fetch_recordings(fetch_server, [], [], [], False, True)
+            # Falls back to GET, and HEAD isn't tried again (other than by probes already running)
+            assert head.call_count <= fetchtv.PROBE_CONCURRENCY
+        assert len(results) == 1
+        assert len(results[0]['items']) == 1
+
+    def test_content_length_head_failed(self):
+        head_rejected = threading.Event()
+        response = Mock(status_code=404, headers={})
+        with patch.object(fetchtv.SESSION, 'head', Mock(return_value=response)):
+            assert fetchtv.get_content_length(mock_item(), head_rejected) == 5
+        assert head_rejected.is_set()
+
+    def test_content_length_head_without_length(self):
+        head_rejected = threading.Event()
+        response = Mock(status_code=200, headers={})
+        with patch.object(fetchtv.SESSION, 'head', Mock(return_value=response)):
+            assert fetchtv.get_content_length(mock_item(), head_rejected) == 5
+        assert head_rejected.is_set()
+
+    def test_content_length_missing(self):
+        head_rejected = threading.Event()
+        head_rejected.set()
+        response = mock_get(URL_DUMMY)
+        response.headers = {}
+        with patch.object(fetchtv.SESSION, 'get', Mock(return_value=response)):
+            with pytest.raises(requests.RequestException):
+                fetchtv.get_content_length(mock_item(), head_rejected)
+
     def test_exclude_one_show(self):
         fetch_server = Mock()
         fetch_server.url = URL_DUMMY
@@ -248,6 +319,8 @@ class TestGetFetchRecordings:
         assert len(results[0]['items']) == 2
 
 @patch('requests.get', mock_get)
+@patch.object(fetchtv.SESSION, 'get', mock_get)
+@patch.object(fetchtv.SESSION, 'head', mock_head)
 @patch('requests.post', mock_post)
 class TestSaveRecordings:
 
@@ -259,12 +332,12 @@ class TestSaveRecordings:
         recordings = fetchtv.get_fetch_recordings(fetch_server, [SHOW_ONE], [], [SHOW_ONE_EP_ONE], False, False)
         show_folder = fetchtv.create_valid_filename(recordings[0]['title'])
         filename = fetchtv.create_valid_filename(recordings[0]['items'][0].title)
-        lock_file = f'{temp_dir}{os.path.sep}{show_folder}{os.path.sep}{filename}.mpeg.lock'
+        lock_file = f'{temp_dir}{os.path.sep}{show_folder}{os.path.sep}{filename}.mpeg.inprogress'
 
         try:
             os.mkdir(temp_dir + os.path.sep + show_folder)
             with open(lock_file, 'x') as f:
-                f.write('.')
+                f.write(str(os.getpid()))
             json_result = fetchtv.save_recordings(recordings, temp_dir, False)
             assert json_result[0]['warning'].startswith('Already writing')
             assert not json_result[0]['recorded']
@@ -272,8 +345,180 @@ class TestSaveRecordings:
             os.remove(lock_file)
             os.rmdir(temp_dir + os.path.sep + show_folder)
 
+    def test_save_recordings_concurrently(self, tmp_path):
+        fetch_server = Mock()
+        fetch_server.url = URL_DUMMY
+        recordings = fetchtv.get_fetch_recordings(
+            fetch_server, [SHOW_ONE], [], [SHOW_ONE_EP_ONE, SHOW_ONE_EP_TWO], False, False
+        )
+        with patch.object(fetchtv, 'download_file', Mock(return_value=True)) as download:
+            json_result = fetchtv.save_recordings(recordings, str(tmp_path), False, concurrency=2)
+
+        assert download.call_count == 2
+        # Results keep the order of the recordings, not completion order
+        assert [result['item']['id'] for result in json_result] == [item.id for item in recordings[0]['items']]
+        assert all(result['recorded'] for result in json_result)
+        saved_files = fetchtv.SavedFiles.load(str(tmp_path))
+        assert all(saved_files.contains(item) for item in recordings[0]['items'])
+
+    def test_save_recordings_interrupted(self, tmp_path):
+        fetch_server = Mock()
+        fetch_server.url = URL_DUMMY
+        recordings = fetchtv.get_fetch_recordings(fetch_server, [SHOW_ONE], [], [], False, False)
+        interrupted = threading.Event()
+
+        def download_file(*args):
+            if not interrupted.is_set():
+                interrupted.set()
+                raise KeyboardInterrupt
+            # Still downloading when the save is interrupted
+            time.sleep(0.2)
+            return False
+
+        with patch.object(fetchtv, 'download_file', Mock(side_effect=download_file)) as download:
+            with pytest.raises(KeyboardInterrupt):
+                fetchtv.save_recordings(recordings, str(tmp_path), False, concurrency=1)
+
+        # At most the item already being downloaded starts, the queued items are cancelled
+        assert download.call_count <= 2
+        assert len(recordings[0]['items']) > 2
+
+    def test_save_recordings_interrupted_mid_download(self, tmp_path):
+        fetch_server = Mock()
+        fetch_server.url = URL_DUMMY
+        recordings = fetchtv.get_fetch_recordings(
+            fetch_server, [SHOW_ONE], [], [SHOW_ONE_EP_ONE, SHOW_ONE_EP_TWO], False, False
+        )
+        first, second = recordings[0]['items']
+        streaming = threading.Event()
+
+        def chunks():
+            # Would take 5 seconds if not stopped
+            for _ in range(500):
+                streaming.set()
+                yield b'x'
+                time.sleep(0.01)
+
+        def get(p_url, timeout=0, stream=False, headers=None):
+            if p_url == first.url:
+                # Ctrl-C while the second item is downloading
+                streaming.wait(timeout=5)
+                raise KeyboardInterrupt
+            response = mock_get(p_url)
+            response.iter_content = Mock(return_value=chunks())
+            return response
+
+        started = time.monotonic()
+        with patch.object(fetchtv.SESSION, 'get', Mock(side_effect=get)):
+            with pytest.raises(KeyboardInterrupt):
+                fetchtv.save_recordings(recordings, str(tmp_path), False, concurrency=2)
+
+        assert time.monotonic() - started < 2
+        # Partial file is kept to be resumed
+        file_path = os.path.join(
+            tmp_path, fetchtv.create_valid_filename(recordings[0]['title']), fetchtv.create_valid_filename(second.title)
+        )
+        assert os.path.exists(file_path + '.mpeg' + fetchtv.CONST_LOCK)
+        assert not os.path.exists(file_path + '.mpeg')
+
+    def test_save_currently_recording(self, tmp_path):
+        fetch_server = Mock()
+        fetch_server.url = URL_DUMMY
+        recordings = fetchtv.get_fetch_recordings(fetch_server, [], [], [], False, True)
+        with patch.object(fetchtv.SESSION, 'get', Mock(side_effect=mock_get)) as get:
+            json_result = fetchtv.save_recordings(recordings, str(tmp_path), False)
+
+        # Length is already known from the currently recording check
+        get.assert_not_called()
+        assert len(json_result) == 1
+        assert json_result[0]['warning'] == "Skipping item it's currently recording"
+        assert not json_result[0]['recorded']
+
 
 @patch('requests.get', mock_get)
+class TestDiscoverFetch:
+
+    def test_discovery_is_cached(self, tmp_path):
+        with patch.object(fetchtv, 'CACHE_FILE', str(tmp_path / 'location.json')):
+            with patch.object(fetchtv.upnp, 'ssdp_discovery', Mock(return_value=[URL_DUMMY])) as discovery:
+                assert fetchtv.discover_fetch().url == URL_DUMMY
+                assert fetchtv.load_cached_location() == URL_DUMMY
+
+                # Cached location is used instead of discovery
+                assert fetchtv.discover_fetch().url == URL_DUMMY
+                assert discovery.call_count == 1
+
+                fetchtv.discover_fetch(refresh=True)
+                assert discovery.call_count == 2
+
+                fetchtv.discover_fetch(use_cache=False)
+                assert discovery.call_count == 3
+
+    def test_invalid_cache_falls_back_to_discovery(self, tmp_path):
+        cache_file = tmp_path / 'location.json'
+        cache_file.write_text(json.dumps({'url': URL_NO_RECORDINGS, 'timestamp': time.time()}))
+
+        def get(p_url, timeout=0, stream=False):
+            if p_url == URL_NO_RECORDINGS:
+                raise requests.HTTPError('404 Client Error: Not Found')
+            return mock_get(p_url, timeout, stream)
+
+        with patch.object(fetchtv, 'CACHE_FILE', str(cache_file)), patch('requests.get', get):
+            with patch.object(fetchtv.upnp, 'ssdp_discovery', Mock(return_value=[URL_DUMMY])) as discovery:
+                assert fetchtv.discover_fetch().url == URL_DUMMY
+                discovery.assert_called_once()
+        # Cache is updated with the newly discovered location
+        assert json.loads(cache_file.read_text())['url'] == URL_DUMMY
+
+    def test_expired_cache_is_ignored(self, tmp_path):
+        cache_file = tmp_path / 'location.json'
+        cache_file.write_text(json.dumps({'url': URL_DUMMY, 'timestamp': 0}))
+        with patch.object(fetchtv, 'CACHE_FILE', str(cache_file)):
+            assert fetchtv.load_cached_location() is None
+
+
+class TestCreateValidFilename:
+
+    def test_special_characters_and_whitespace(self):
+        assert fetchtv.create_valid_filename(' S4 E12: <What>\t"If"/\\|?* ') == 'S4_E12_What_If'
+
+    def test_max_length(self):
+        assert len(fetchtv.create_valid_filename('x' * 300)) == fetchtv.MAX_FILENAME
+
+
+class TestSavedFiles:
+
+    def test_add_file_is_flushed_in_batches(self, tmp_path):
+        save_file = tmp_path / fetchtv.SAVE_FILE
+        saved_files = fetchtv.SavedFiles.load(str(tmp_path))
+        item = Mock()
+        item.id = '1'
+        item.title = SHOW_ONE_EP_ONE
+
+        saved_files.add_file(item)
+        assert saved_files.contains(item)
+        # Nothing is written until flushed
+        assert not save_file.exists()
+        assert not saved_files.flush_due()
+
+        saved_files.flush()
+        assert fetchtv.SavedFiles.load(str(tmp_path)).contains(item)
+
+    def test_load_previous_format(self, tmp_path):
+        save_file = tmp_path / fetchtv.SAVE_FILE
+        item = Mock()
+        item.id = '1'
+        save_file.write_text(
+            '{"py/object": "fetchtv_cli.fetchtv_cli.SavedFiles", "_SavedFiles__files": {"1": "S4 E12"}, "path": ""}'
+        )
+        saved_files = fetchtv.SavedFiles.load(str(tmp_path))
+        assert saved_files.contains(item)
+        assert not saved_files.flush_due()
+        # Converted to the current format
+        assert json.loads(save_file.read_text()) == {'path': str(tmp_path), 'files': {'1': 'S4 E12'}}
+
+
+@patch.object(fetchtv.SESSION, 'get', mock_get)
 class TestDownloadFile:
 
     def test_save_item(self, tmp_path):
@@ -286,4 +531,121 @@ class TestDownloadFile:
         mock_location.url = URL_DUMMY
         with patch('fetchtv_cli.fetchtv_cli.open', mock_file):
             with patch('fetchtv_cli.fetchtv_cli.os.rename', Mock()):
-                pass
\ No newline at end of file
+                pass
+
+    def test_download_item(self, tmp_path):
+        temp_file = tmp_path / 'test.mpeg'
+        response = mock_get(URL_DUMMY)
+        response.iter_content = Mock(return_value=[b'abc', b'', b'de'])
+        with patch.object(fetchtv.SESSION, 'get', Mock(return_value=response)):
+            json_result = {}
+            assert fetchtv.download_file(mock_item(), str(temp_file), json_result)
+
+        assert temp_file.read_bytes() == b'abcde'
+        assert not json_result
+
+    def test_download_item_shared_progress(self, tmp_path):
+        response = mock_get(URL_DUMMY)
+        response.iter_content = Mock(return_value=[b'abcde'])
+        progress = fetchtv.create_progress()
+        with patch.object(fetchtv.SESSION, 'get', Mock(return_value=response)):
+            assert fetchtv.download_file(mock_item(), str(tmp_path / 'test.mpeg'), {}, progress)
+
+        # Finished items are removed from the shared display
+        assert not progress.tasks
+
+    def test_resume_item(self, tmp_path):
+        temp_file = tmp_path / 'test.mpeg'
+        (tmp_path / 'test.mpeg.lock').write_bytes(b'abc')
+        response = mock_partial_get(b'de', 3, 5)
+        with patch.object(fetchtv.SESSION, 'get', Mock(return_value=response)) as get:
+            assert fetchtv.download_file(mock_item(), str(temp_file), {})
+
+        assert get.call_args.kwargs['headers'] == {'Range': 'bytes=3-'}
+        assert temp_file.read_bytes() == b'abcde'
+        assert not (tmp_path / 'test.mpeg.inprogress').exists()
+
+    def test_resume_not_supported(self, tmp_path):
+        temp_file = tmp_path / 'test.mpeg'
+        (tmp_path / 'test.mpeg.lock').write_bytes(b'xyz')
+        response = mock_get(URL_DUMMY)
+        response.iter_content = Mock(return_value=[b'abcde'])
+        with patch.object(fetchtv.SESSION, 'get', Mock(return_value=response)):
+            assert fetchtv.download_file(mock_item(), str(temp_file), {})
+
+        # The whole item was sent, so the partial file is replaced
+        assert temp_file.read_bytes() == b'abcde'
+
+    def test_resume_already_complete(self, tmp_path):
+        temp_file = tmp_path / 'test.mpeg'
+        (tmp_path / 'test.mpeg.lock').write_bytes(b'abcde')
+        response = mock_get(URL_DUMMY)
+        response.status_code = 416
+        response.headers = {'content-range': 'bytes */5'}
+        with patch.object(fetchtv.SESSION, 'get', Mock(return_value=response)) as get:
+            assert fetchtv.download_file(mock_item(), str(temp_file), {})
+
+        get.assert_called_once()
+        assert temp_file.read_bytes() == b'abcde'
+
+    def test_resume_partial_too_long(self, tmp_path):
+        temp_file = tmp_path / 'test.mpeg'
+        (tmp_path / 'test.mpeg.lock').write_bytes(b'vwxyz!')
+        not_satisfiable = mock_get(URL_DUMMY)
+        not_satisfiable.status_code = 416
+        not_satisfiable.headers = {'content-range': 'bytes */5'}
+        response = mock_get(URL_DUMMY)
+        response.iter_content = Mock(return_value=[b'abcde'])
+        with patch.object(fetchtv.SESSION, 'get', Mock(side_effect=[not_satisfiable, response])) as get:
+            assert fetchtv.download_file(mock_item(), str(temp_file), {})
+
+        # The partial file is discarded, and the whole item requested
+        assert get.call_args.kwargs['headers'] == {}
+        assert temp_file.read_bytes() == b'abcde'
+
+    def test_already_writing_item(self, tmp_path):
+        temp_file = tmp_path / 'test.mpeg'
+        (tmp_path / 'test.mpeg.inprogress').write_text(str(os.getpid()))
+        with patch.object(fetchtv.SESSION, 'get', Mock(side_effect=mock_get)) as get:
+            json_result = {}
+            assert not fetchtv.download_file(mock_item(), str(temp_file), json_result)
+
+        get.assert_not_called()
+        assert json_result['warning'].startswith('Already writing')
+        assert (tmp_path / 'test.mpeg.inprogress').exists()
+
+    def test_in_progress_marker_being_created(self, tmp_path):
+        temp_file = tmp_path / 'test.mpeg'
+        (tmp_path / 'test.mpeg.inprogress').write_text('')
+        with patch.object(fetchtv.SESSION, 'get', Mock(side_effect=mock_get)) as get:
+            assert not fetchtv.download_file(mock_item(), str(temp_file), {})
+
+        get.assert_not_called()
+        assert (tmp_path / 'test.mpeg.inprogress').exists()
+
+    def test_in_progress_marker_left_empty(self, tmp_path):
+        temp_file = tmp_path / 'test.mpeg'
+        in_progress = tmp_path / 'test.mpeg.inprogress'
+        in_progress.write_text('')
+        created = time.time() - fetchtv.IN_PROGRESS_GRACE - 1
+        os.utime(in_progress, (created, created))
+        response = mock_get(URL_DUMMY)
+        response.iter_content = Mock(return_value=[b'abcde'])
+        with patch.object(fetchtv.SESSION, 'get', Mock(return_value=response)):
+            assert fetchtv.download_file(mock_item(), str(temp_file), {})
+
+        assert temp_file.read_bytes() == b'abcde'
+        assert not in_progress.exists()
+
+    def test_resume_after_writer_killed(self, tmp_path):
+        temp_file = tmp_path / 'test.mpeg'
+        (tmp_path / 'test.mpeg.lock').write_bytes(b'abc')
+        writer = subprocess.Popen([sys.executable, '-c', ''])
+        writer.wait()
+        (tmp_path / 'test.mpeg.inprogress').write_text(str(writer.pid))
+        response = mock_partial_get(b'de', 3, 5)
+        with patch.object(fetchtv.SESSION, 'get', Mock(return_value=response)):
+            assert fetchtv.download_file(mock_item(), str(temp_file), {})
+
+        assert temp_file.read_bytes() == b'abcde'
+        assert not (tmp_path / 'test.mpeg.inprogress').exists()